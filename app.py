@@ -1,21 +1,164 @@
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
+import queue
 import sqlite3
+from contextlib import contextmanager
+
+import orjson
+import redis
+from flask_compress import Compress
 
 app = Flask(__name__)
 CORS(app)
 
+# compress large JSON responses (student/class lists) once in C;
+# anything under 500 bytes isn't worth the CPU
+app.config["COMPRESS_ALGORITHM"] = ["zstd", "br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 500
+Compress(app)
+
 DB_NAME = "attendance.db"
+POOL_SIZE = 5
+BULK_CHUNK_SIZE = 1000
+# uploads bigger than this (~5k CSV rows) rebuild idx_students_class
+# after the insert instead of rebalancing it per row
+BULK_REINDEX_BYTES = 250_000
+
+# Cache for the read-heavy "student checks own %" endpoint. Entries are
+# invalidated when attendance is marked; a short TTL covers anything missed.
+# Cache errors are swallowed so the app keeps working if Redis is down.
+cache = redis.Redis(decode_responses=True)
+CACHE_TTL = 60
+
+
+class SQLitePool:
+    """Thread-safe pool of warm SQLite connections.
+
+    Opening a connection per request pays file-open + page-cache warmup
+    on every query; checking out a pre-configured handle avoids that.
+    """
+
+    def __init__(self, db_name, size=POOL_SIZE):
+        self._pool = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(self._make_conn(db_name))
+
+    @staticmethod
+    def _make_conn(db_name):
+        conn = sqlite3.connect(
+            db_name,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA cache_size=-32000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # serve read pages via mmap instead of read() syscalls
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self):
+        return self._pool.get()
+
+    def put(self, conn):
+        self._pool.put(conn)
 
 
+pool = SQLitePool(DB_NAME)
+
+
+@contextmanager
 def get_conn():
-    return sqlite3.connect(DB_NAME)
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        # never park a connection with an open transaction: a route that
+        # errors between BEGIN and commit would otherwise poison the pool
+        # (and a later commit from an unrelated route would flush its
+        # half-finished work)
+        if conn.in_transaction:
+            conn.rollback()
+        pool.put(conn)
+
+
+def jresp(obj, status=200):
+    """JSON response via orjson (C serializer) instead of stdlib json."""
+    return app.response_class(
+        orjson.dumps(obj), status=status, mimetype="application/json"
+    )
+
+
+# ========== SQL STATEMENTS ==========
+# Hoisted to module level so each connection's statement cache is keyed
+# on a stable string and never reparses these.
+
+# ON CONFLICT DO NOTHING + RETURNING makes the duplicate path a NULL
+# check instead of raising/catching IntegrityError per bad request.
+SQL_INSERT_CLASS = """
+    INSERT INTO classes (class_id, class_name, department) VALUES (?, ?, ?)
+    ON CONFLICT DO NOTHING RETURNING class_id
+"""
+SQL_SELECT_CLASSES = "SELECT class_id, class_name, department FROM classes"
+SQL_INSERT_STUDENT = """
+    INSERT INTO students (reg_no, student_name, class_id) VALUES (?, ?, ?)
+    ON CONFLICT DO NOTHING RETURNING reg_no
+"""
+# keyset pagination: cheaper than OFFSET and bounds the rows Python
+# ever holds for one response
+SQL_SELECT_STUDENTS_PAGE = """
+    SELECT reg_no, student_name, class_id FROM students
+    WHERE reg_no > ? AND (? = '' OR class_id = ?)
+    ORDER BY reg_no
+    LIMIT ?
+"""
+SQL_BULK_INSERT_STUDENT = (
+    "INSERT OR IGNORE INTO students (reg_no, student_name, class_id) VALUES (?, ?, ?)"
+)
+SQL_INSERT_PERIOD = """
+    INSERT INTO periods (class_id, subject_name, period_date, period_number)
+    VALUES (?, ?, ?, ?)
+"""
+# UPSERT updates the conflicting row in place; OR REPLACE would delete
+# and re-insert, doing index maintenance twice.
+SQL_MARK_ATTENDANCE = """
+    INSERT INTO attendance (period_id, reg_no, is_present)
+    VALUES (?, ?, ?)
+    ON CONFLICT(period_id, reg_no) DO UPDATE SET is_present = excluded.is_present
+"""
+# O(1) PK lookups against the trigger-maintained rollup instead of
+# aggregating every attendance row on each request
+SQL_OVERALL_ATTENDANCE = """
+    SELECT
+        s.reg_no,
+        s.student_name,
+        COALESCE(r.total, 0) as total_classes,
+        COALESCE(r.attended, 0) as attended_classes
+    FROM students s
+    LEFT JOIN student_rollup r ON s.reg_no = r.reg_no
+    WHERE s.reg_no = ?
+"""
 
 
 def init_db():
-    conn = get_conn()
+    conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
 
+    # WAL lets readers run while a writer commits, and NORMAL sync cuts
+    # the fsync-per-commit cost. journal_mode persists on the DB file;
+    # the per-connection pragmas are re-set in the pool factory.
+    # page_size only takes effect if set before the first table is
+    # created; no-op on an existing database.
+    c.execute("PRAGMA page_size=4096")
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA busy_timeout=5000")
+    c.execute("PRAGMA journal_size_limit=6144000")
+
     # classes table
     c.execute(
         """
@@ -53,9 +196,11 @@ def init_db():
         """
     )
 
-    # attendance table (one row per student per period)
-    c.execute(
-        """
+    # attendance table (one row per student per period). WITHOUT ROWID
+    # clusters rows in the PK btree; a rowid table would store the
+    # (period_id, reg_no) key twice — once in the rowid btree and again
+    # in the implicit PK index — doubling the biggest table's pages.
+    attendance_ddl = """
         CREATE TABLE IF NOT EXISTS attendance (
             period_id INTEGER,
             reg_no TEXT,
@@ -63,15 +208,108 @@ def init_db():
             PRIMARY KEY (period_id, reg_no),
             FOREIGN KEY (period_id) REFERENCES periods(period_id),
             FOREIGN KEY (reg_no) REFERENCES students(reg_no)
+        ) WITHOUT ROWID
+    """
+    c.execute(attendance_ddl)
+
+    # migrate a pre-existing rowid attendance table in place
+    existing = c.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='attendance'"
+    ).fetchone()
+    if "WITHOUT ROWID" not in existing[0].upper():
+        # drop the rollup triggers so the copy doesn't double-count;
+        # they are recreated below
+        c.execute("DROP TRIGGER IF EXISTS att_rollup_ins")
+        c.execute("DROP TRIGGER IF EXISTS att_rollup_upd")
+        c.execute("DROP TRIGGER IF EXISTS att_rollup_del")
+        c.execute("ALTER TABLE attendance RENAME TO attendance_old")
+        c.execute(attendance_ddl)
+        c.execute(
+            "INSERT INTO attendance SELECT period_id, reg_no, is_present FROM attendance_old"
         )
+        c.execute("DROP TABLE attendance_old")
+
+    # materialized per-student aggregate so get_overall_attendance is a
+    # PK lookup instead of scanning every attendance row
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS student_rollup (
+            reg_no TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            attended INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+    # backfill once if attendance already has data the rollup doesn't
+    c.execute(
+        """
+        INSERT INTO student_rollup (reg_no, total, attended)
+        SELECT reg_no, COUNT(*), COALESCE(SUM(is_present), 0)
+        FROM attendance
+        WHERE NOT EXISTS (SELECT 1 FROM student_rollup)
+        GROUP BY reg_no
+        """
+    )
+
+    # keep the rollup in sync with every attendance change
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS att_rollup_ins AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO student_rollup (reg_no, total, attended)
+            VALUES (NEW.reg_no, 1, NEW.is_present)
+            ON CONFLICT(reg_no) DO UPDATE SET
+                total = total + 1,
+                attended = attended + NEW.is_present;
+        END
+        """
+    )
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS att_rollup_upd AFTER UPDATE ON attendance
+        BEGIN
+            UPDATE student_rollup
+            SET attended = attended - OLD.is_present + NEW.is_present
+            WHERE reg_no = NEW.reg_no;
+        END
+        """
+    )
+    c.execute(
         """
+        CREATE TRIGGER IF NOT EXISTS att_rollup_del AFTER DELETE ON attendance
+        BEGIN
+            UPDATE student_rollup
+            SET total = total - 1, attended = attended - OLD.is_present
+            WHERE reg_no = OLD.reg_no;
+        END
+        """
+    )
+
+    # covering index for the attendance aggregate in get_overall_attendance,
+    # and a class filter index for get_students?class_id=
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attendance_regno ON attendance(reg_no, is_present)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_students_class ON students(class_id)"
     )
+    c.execute("ANALYZE")
 
     conn.commit()
     conn.close()
 
 
-init_db()
+@app.cli.command("init-db")
+def init_db_command():
+    """Create tables, indexes and pragmas (idempotent).
+
+    Run once at deploy time (`flask init-db`) instead of at import, so
+    gunicorn workers don't all replay the DDL against the write lock on
+    every fork.
+    """
+    init_db()
+    print("Database initialized.")
 
 
 # ========== ROUTES FOR WEB PAGES ==========
@@ -97,34 +335,27 @@ def staff_panel():
 @app.route("/api/classes", methods=["POST"])
 def add_class():
     data = request.json
-    conn = get_conn()
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT INTO classes (class_id, class_name, department) VALUES (?, ?, ?)",
-            (data["class_id"], data["class_name"], data.get("department", "")),
-        )
-        conn.commit()
-        conn.close()
-        return jsonify({"message": "Class added"}), 201
-    except sqlite3.IntegrityError:
-        conn.close()
-        return jsonify({"error": "Class ID already exists"}), 400
+    with get_conn() as conn:
+        try:
+            row = conn.execute(
+                SQL_INSERT_CLASS,
+                (data["class_id"], data["class_name"], data.get("department", "")),
+            ).fetchone()
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # duplicates are absorbed by ON CONFLICT DO NOTHING; this is
+            # some other constraint failure (e.g. NOT NULL)
+            return jsonify({"error": "Invalid class data"}), 400
+    if row is None:
+        return jsonify({"error": "Class ID already exists"}), 409
+    return jsonify({"message": "Class added"}), 201
 
 
 @app.route("/api/classes", methods=["GET"])
 def get_classes():
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT class_id, class_name, department FROM classes")
-    rows = c.fetchall()
-    conn.close()
-    return jsonify(
-        [
-            {"class_id": r[0], "class_name": r[1], "department": r[2]}
-            for r in rows
-        ]
-    )
+    with get_conn() as conn:
+        cur = conn.execute(SQL_SELECT_CLASSES)
+        return jresp([dict(r) for r in cur])
 
 
 # ========== API ROUTES - STUDENTS ==========
@@ -132,41 +363,37 @@ def get_classes():
 @app.route("/api/students", methods=["POST"])
 def add_student():
     data = request.json
-    conn = get_conn()
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT INTO students (reg_no, student_name, class_id) VALUES (?, ?, ?)",
-            (data["reg_no"], data["student_name"], data["class_id"]),
-        )
-        conn.commit()
-        conn.close()
-        return jsonify({"message": "Student added"}), 201
-    except sqlite3.IntegrityError:
-        conn.close()
-        return jsonify({"error": "Student registration number already exists"}), 400
+    with get_conn() as conn:
+        try:
+            row = conn.execute(
+                SQL_INSERT_STUDENT,
+                (data["reg_no"], data["student_name"], data["class_id"]),
+            ).fetchone()
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # duplicates are absorbed by ON CONFLICT DO NOTHING; this is
+            # some other constraint failure (e.g. NOT NULL)
+            return jsonify({"error": "Invalid student data"}), 400
+    if row is None:
+        return jsonify({"error": "Student registration number already exists"}), 409
+    return jsonify({"message": "Student added"}), 201
 
 
 @app.route("/api/students", methods=["GET"])
 def get_students():
-    class_id = request.args.get("class_id")
-    conn = get_conn()
-    c = conn.cursor()
-    if class_id:
-        c.execute(
-            "SELECT reg_no, student_name, class_id FROM students WHERE class_id = ?",
-            (class_id,),
-        )
-    else:
-        c.execute("SELECT reg_no, student_name, class_id FROM students")
-    rows = c.fetchall()
-    conn.close()
-    return jsonify(
-        [
-            {"reg_no": r[0], "student_name": r[1], "class_id": r[2]}
-            for r in rows
-        ]
-    )
+    class_id = request.args.get("class_id", "")
+    after = request.args.get("after", "")
+    try:
+        limit = max(1, min(int(request.args.get("limit", 200)), 500))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    with get_conn() as conn:
+        cur = conn.execute(SQL_SELECT_STUDENTS_PAGE, (after, class_id, class_id, limit))
+        items = [dict(r) for r in cur]
+
+    next_cursor = items[-1]["reg_no"] if len(items) == limit else None
+    return jresp({"items": items, "next": next_cursor})
 
 
 # ========== API ROUTES - BULK UPLOAD ==========
@@ -175,6 +402,7 @@ def get_students():
 def bulk_add_students():
     import csv
     import io
+    import itertools
 
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -185,33 +413,68 @@ def bulk_add_students():
         return jsonify({'error': 'No file selected'}), 400
 
     try:
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
+        # Wrap the upload stream directly instead of reading the whole
+        # file into memory, so parsing stays O(row) regardless of size.
+        stream = io.TextIOWrapper(file.stream, encoding="utf-8", newline="")
         csv_reader = csv.reader(stream)
 
         # Skip header row
         next(csv_reader, None)
 
-        conn = get_conn()
-        c = conn.cursor()
-
         added = 0
         skipped = 0
 
-        for row in csv_reader:
-            if len(row) < 3:  # Skip incomplete rows
-                continue
-            try:
-                c.execute(
-                    'INSERT INTO students (reg_no, student_name, class_id) VALUES (?, ?, ?)',
-                    (row[0].strip(), row[1].strip(), int(row[2].strip()))
-                )
-                added += 1
-            except (sqlite3.IntegrityError, ValueError):
-                skipped += 1
-                continue
+        def parsed_rows():
+            nonlocal skipped
+            for row in csv_reader:
+                if len(row) < 3:  # Skip incomplete rows
+                    continue
+                # fast path: a C-level digit scan covers well-formed rows
+                # without try/except. Anything else (leading '+',
+                # underscore separators, junk) falls back to int() per
+                # row so exactly the rows int() rejects are skipped.
+                cid = row[2].strip()
+                if cid.isascii() and cid.removeprefix("-").isdecimal():
+                    yield (row[0].strip(), row[1].strip(), int(cid))
+                    continue
+                try:
+                    yield (row[0].strip(), row[1].strip(), int(cid))
+                except ValueError:
+                    skipped += 1
+
+        # Insert in bounded chunks via executemany; OR IGNORE skips
+        # duplicates without aborting the batch.
+        # for very large imports, dropping the secondary index and
+        # recreating it once beats per-row btree maintenance
+        rebuild_index = bool(
+            file.content_length and file.content_length > BULK_REINDEX_BYTES
+        )
 
-        conn.commit()
-        conn.close()
+        rows = parsed_rows()
+        with get_conn() as conn:
+            c = conn.cursor()
+            if rebuild_index:
+                c.execute("DROP INDEX IF EXISTS idx_students_class")
+            try:
+                while True:
+                    chunk = list(itertools.islice(rows, BULK_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    conn.execute("BEGIN")
+                    c.executemany(SQL_BULK_INSERT_STUDENT, chunk)
+                    added += c.rowcount
+                    skipped += len(chunk) - c.rowcount
+                    conn.commit()
+            finally:
+                if rebuild_index:
+                    # a failed chunk leaves its transaction open; roll it
+                    # back first so the CREATE INDEX commits in autocommit
+                    # instead of being rolled back with the chunk
+                    if conn.in_transaction:
+                        conn.rollback()
+                    c.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_students_class ON students(class_id)"
+                    )
 
         return jsonify({
             'message': f'{added} students added successfully, {skipped} skipped (duplicates or errors)'
@@ -226,23 +489,19 @@ def bulk_add_students():
 @app.route("/api/periods", methods=["POST"])
 def create_period():
     data = request.json
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute(
-        """
-        INSERT INTO periods (class_id, subject_name, period_date, period_number)
-        VALUES (?, ?, ?, ?)
-        """,
-        (
-            data["class_id"],
-            data["subject_name"],
-            data["period_date"],  # e.g. "2025-12-15"
-            data["period_number"],  # 1,2,3,4...
-        ),
-    )
-    period_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            SQL_INSERT_PERIOD,
+            (
+                data["class_id"],
+                data["subject_name"],
+                data["period_date"],  # e.g. "2025-12-15"
+                data["period_number"],  # 1,2,3,4...
+            ),
+        )
+        period_id = c.lastrowid
+        conn.commit()
     return jsonify({"message": "Period created", "period_id": period_id}), 201
 
 
@@ -264,67 +523,83 @@ def mark_attendance():
     period_id = data["period_id"]
     attendance_list = data["attendance"]
 
-    conn = get_conn()
-    c = conn.cursor()
-    for record in attendance_list:
-        c.execute(
-            """
-            INSERT OR REPLACE INTO attendance (period_id, reg_no, is_present)
-            VALUES (?, ?, ?)
-            """,
-            (period_id, record["reg_no"], record["is_present"]),
-        )
-    conn.commit()
-    conn.close()
+    if not attendance_list:
+        return jsonify({"error": "Attendance list is empty"}), 400
+    if len(attendance_list) > 500:
+        return jsonify({"error": "Attendance list too large (max 500)"}), 400
+
+    params = [
+        (period_id, record["reg_no"], record["is_present"])
+        for record in attendance_list
+    ]
+
+    # Single executemany in one transaction instead of one INSERT per
+    # student, so the whole class commits with one fsync.
+    with get_conn() as conn:
+        conn.execute("BEGIN")
+        conn.executemany(SQL_MARK_ATTENDANCE, params)
+        conn.commit()
+
+    # drop cached percentages for every student in this batch
+    try:
+        pipe = cache.pipeline()
+        for record in attendance_list:
+            pipe.delete(f"att:{record['reg_no']}")
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
     return jsonify({"message": "Attendance saved"}), 200
 
 
 @app.route("/api/attendance/<reg_no>", methods=["GET"])
 def get_overall_attendance(reg_no):
-    conn = get_conn()
-    c = conn.cursor()
+    cache_key = f"att:{reg_no}"
+    try:
+        cached = cache.get(cache_key)
+    except redis.RedisError:
+        cached = None
+    if cached is not None:
+        return app.response_class(cached, mimetype="application/json")
 
-    c.execute(
-        """
-        SELECT
-            s.reg_no,
-            s.student_name,
-            COUNT(a.period_id) as total_classes,
-            SUM(CASE WHEN a.is_present = 1 THEN 1 ELSE 0 END) as attended_classes
-        FROM students s
-        LEFT JOIN attendance a ON s.reg_no = a.reg_no
-        WHERE s.reg_no = ?
-        GROUP BY s.reg_no, s.student_name
-        """,
-        (reg_no,),
-    )
+    with get_conn() as conn:
+        c = conn.cursor()
 
-    row = c.fetchone()
-    conn.close()
+        c.execute(SQL_OVERALL_ATTENDANCE, (reg_no,))
+        row = c.fetchone()
 
     if not row:
         return jsonify({"error": "Student not found"}), 404
 
-    total_classes = row[2]
-    attended_classes = row[3] if row[3] is not None else 0
+    total_classes = row["total_classes"]
+    attended_classes = row["attended_classes"] if row["attended_classes"] is not None else 0
 
     if total_classes and total_classes > 0:
         percentage = round(attended_classes * 100.0 / total_classes, 2)
     else:
         percentage = 0.0
 
-    return jsonify(
-        {
-            "reg_no": row[0],
-            "student_name": row[1],
-            "total_classes": total_classes,
-            "attended_classes": attended_classes,
-            "attendance_percentage": percentage,
-        }
-    )
+    resp = {
+        "reg_no": row["reg_no"],
+        "student_name": row["student_name"],
+        "total_classes": total_classes,
+        "attended_classes": attended_classes,
+        "attendance_percentage": percentage,
+    }
+
+    payload = orjson.dumps(resp)
+    try:
+        cache.setex(cache_key, CACHE_TTL, payload)
+    except redis.RedisError:
+        pass
+
+    return app.response_class(payload, mimetype="application/json")
 
 
 # ========== RUN APP ==========
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    # threaded=True lets requests overlap on DB waits: sqlite3 releases
+    # the GIL while a query runs, and the pool hands each thread its own
+    # connection (check_same_thread=False).
+    app.run(debug=True, port=5000, threaded=True)
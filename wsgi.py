@@ -0,0 +1,11 @@
+# Production entrypoint. Run with:
+#   gunicorn -k gevent -w 2 --worker-connections 1000 wsgi:app
+#
+# monkey.patch_all() must run before app (and its imports) so socket,
+# queue, etc. become greenlet-aware. sqlite3 releases the GIL during
+# query execution, so greenlets interleave other routes on DB waits.
+from gevent import monkey
+
+monkey.patch_all()
+
+from app import app  # noqa: E402